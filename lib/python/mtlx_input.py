@@ -1,6 +1,10 @@
 import os
+import collections
 import time
 import logging
+import functools
+import itertools
+from xml.etree import ElementTree
 
 import imath
 import IECore
@@ -18,25 +22,66 @@ logger = logging.getLogger(__name__)
 
 PATH_NAME_STRIP_LENGTH = 3
 
-
+# Number of Visibilities sharing one ArnoldAttributes node
+VISIBILITY_GROUP_SIZE = 8
+
+# Share of changed Materials above which a reload rebuilds the whole graph
+REBUILD_CHANGE_RATIO = 0.5
+
+_FIX_TABLE = str.maketrans(":/", "__")
+
+# MaterialX visibility types to ArnoldAttributes plug names
+VISIBILITY_ATTRIBUTES = {
+    "camera": "cameraVisibility",
+    "shadow": "shadowVisibility",
+    "diffuse_transmit": "diffuseTransmissionVisibility",
+    "specular_transmit": "specularTransmissionVisibility",
+    "volume": "volumeVisibility",
+    "diffuse_reflect": "diffuseReflectionVisibility",
+    "specular_reflect": "specularReflectionVisibility",
+    "subsurface": "subsurfaceVisibility",
+}
+
+# Plug types to connection kinds
+PLUG_KINDS = (
+    (Gaffer.FloatPlug, "float"),
+    (Gaffer.IntPlug, "float"),
+    (Gaffer.Color3fPlug, "color3"),
+    (Gaffer.Color4fPlug, "color4"),
+    (Gaffer.V3fPlug, "vector3"),
+)
+
+# (input kind, output kind) to connection mode, other pairs are connected directly
+PLUG_CONNECTIONS = {
+    ("color3", "float"): "first_channel",
+    ("color4", "float"): "first_channel",
+    ("vector3", "float"): "first_channel",
+    ("float", "color3"): "from_channel",
+    ("float", "color4"): "from_channel",
+    ("float", "vector3"): "from_channel",
+    ("color4", "color3"): "rgb",
+    ("color3", "color4"): "rgb",
+    ("color4", "vector3"): "rgb",
+}
+
+# Node types MtlXInput generates as its children
+GENERATED_TYPES = (Gaffer.Box, GafferArnold.ArnoldAttributes, GafferScene.PathFilter)
+
+
+@functools.lru_cache(maxsize=None)
 def fix_str(name):
     """
     Replace symbols with '_' strings
     @param name: str
     @return: str
     """
-    characters = ":/"
-
     if "/" in name:
         split_list = name.split("/")
         if len(split_list) >= PATH_NAME_STRIP_LENGTH - 1:
             split_list = split_list[-PATH_NAME_STRIP_LENGTH:]
             name = "_".join(split_list)
 
-    for char in characters:
-        name = name.replace(char, "_")
-
-    return str(name)
+    return name.translate(_FIX_TABLE)
 
 
 class MtlXInputSerialiser(Gaffer.NodeSerialiser):
@@ -84,6 +129,16 @@ class MtlXInput(GafferScene.SceneNode):
         # MaterialX document object
         self.mtlx_doc = None
 
+        # Parsed documents keyed by (path, mtime, refresh)
+        self._doc_cache = {}
+
+        # Path the graph was last built from
+        self._built_path = None
+
+        # (look index, document id) the assignments and attributes were last set up for
+        self._assigned_look = None
+        self._attributed_look = None
+
         self["mtlXPath"] = Gaffer.StringPlug()
         self["refresh"] = Gaffer.IntPlug()
         self["mtlXLook"] = Gaffer.IntPlug()
@@ -100,6 +155,12 @@ class MtlXInput(GafferScene.SceneNode):
 
         self.plugSetSignal().connect(self.plug_set, scoped=False)
 
+        # Generated children by type, see children_of_type()
+        self._child_index = None
+
+        self.childAddedSignal().connect(self._children_changed, scoped=False)
+        self.childRemovedSignal().connect(self._children_changed, scoped=False)
+
     def hash(self, output, context, h):
         """
         Implementation of native method
@@ -108,16 +169,6 @@ class MtlXInput(GafferScene.SceneNode):
         @param h: IECore.MurmurHash
         @return: None
         """
-        if self["mtlXPath"].hash() != self["resolved"].hash():
-
-            if self.valid_mtlx():
-                self.clear_existing_data()
-                self.load_mtlx()
-            else:
-                self["out"].setInput(self["in"])
-
-            self["resolved"].setValue(self["mtlXPath"].getValue())
-
         h.append(self['mtlXPath'].hash())
         h.append(self["mtlXLook"].hash())
         h.append(self['refresh'].hash())
@@ -146,27 +197,128 @@ class MtlXInput(GafferScene.SceneNode):
         @param plug: Gaffer.Plug
         @return: None
         """
-        if plug.getName() == "refresh":
+        # Generated children are restored by the serialisation or the undo queue,
+        # the document is read again the next time it is needed
+        script_node = self.scriptNode()
+
+        if script_node is not None and (script_node.isExecuting() or
+                                        script_node.currentActionStage() in (Gaffer.Action.Stage.Undo,
+                                                                             Gaffer.Action.Stage.Redo)):
+            self.mtlx_doc = None
+            self._built_path = None
+            self._assigned_look = None
+            self._attributed_look = None
+            return
+
+        if plug.getName() == "mtlXPath":
+
+            self.build_graph()
+
+        elif plug.getName() == "refresh":
+
+            self._assigned_look = None
+            self._attributed_look = None
 
             self["resolved"].setValue("")
+            self.build_graph()
 
         elif plug.getName() == "mtlXLook":
 
             self.setup_assignments(plug.getValue())
 
+    def build_graph(self):
+        """
+        Builds or patches the graph when the file path differs from the resolved one
+        @return: None
+        """
+        if self["mtlXPath"].hash() == self["resolved"].hash():
+            return
+
+        previous_doc = self.mtlx_doc
+
+        if self.valid_mtlx() and self.read_mtlx():
+
+            if not self.update_mtlx(previous_doc):
+                self.clear_existing_data()
+                self.load_mtlx()
+
+            self._built_path = self["mtlXPath"].getValue()
+        else:
+            self._built_path = None
+            self["out"].setInput(self["in"])
+
+        self["resolved"].setValue(self["mtlXPath"].getValue())
+
     def valid_mtlx(self):
         """
-        Validates MaterialX file path
+        Validates MaterialX file path, only the root element is parsed
         @return: bool
         """
-        self.mtlx_doc = mx.createDocument()
+        try:
+            for _, element in ElementTree.iterparse(self["mtlXPath"].getValue(), events=("start",)):
+                if element.tag == "materialx":
+                    return True
+
+                self.status = "Not a MaterialX document"
+                return False
+
+        except (IOError, ElementTree.ParseError) as err:
+            self.status = str(err)
+
+        return False
+
+    def doc_key(self):
+        """
+        Gets the key identifying the current MaterialX file state
+        @return: tuple or None if the file is not accessible
+        """
+        path = self["mtlXPath"].getValue()
 
         try:
-            mx.readFromXmlFile(self.mtlx_doc, self["mtlXPath"].getValue())
-            return True
-        except mx.ExceptionFileMissing as err:
+            return path, os.path.getmtime(path), self["refresh"].getValue()
+        except OSError as err:
             self.status = str(err)
 
+    def read_mtlx(self):
+        """
+        Reads MaterialX document, reuses the cached one if the file has not changed
+        @return: bool
+        """
+        key = self.doc_key()
+
+        if key is None:
+            return False
+
+        mtlx_doc = self._doc_cache.get(key)
+
+        if mtlx_doc is None:
+            mtlx_doc = mx.createDocument()
+
+            try:
+                mx.readFromXmlFile(mtlx_doc, key[0])
+            except (mx.ExceptionFileMissing, mx.ExceptionParseError) as err:
+                self.status = str(err)
+                return False
+
+            fix_str.cache_clear()
+            self._register_look_presets(mtlx_doc)
+
+            self._doc_cache = {key: mtlx_doc}
+
+        self.mtlx_doc = mtlx_doc
+        return True
+
+    def _register_look_presets(self, mtlx_doc):
+        """
+        Registers document Looks as mtlXLook presets
+        @param mtlx_doc: mx.Document
+        @return: None
+        """
+        for idx, look in enumerate(mtlx_doc.getLooks()):
+
+            look_name = str(look.getName())
+            Gaffer.Metadata.registerPlugValue(self["mtlXLook"], "preset:" + look_name, idx)
+
     def load_mtlx(self):
         """
         Loads MaterialX to the graph
@@ -174,6 +326,9 @@ class MtlXInput(GafferScene.SceneNode):
         """
         x = time.time()
 
+        if not self.read_mtlx():
+            return
+
         if self["applyMaterials"].getValue():
             self.setup_materials()
 
@@ -186,39 +341,229 @@ class MtlXInput(GafferScene.SceneNode):
         # Sets status
         self.status = "%d Materials loaded in %.2f seconds" % (len(self.material_list()), time.time() - x)
 
+    def update_mtlx(self, previous_doc):
+        """
+        Patches the existing graph when the same file was saved again. Removed Materials
+        are deleted, added and restructured ones are rebuilt, and value-only changes are
+        set on the existing plugs. Assignments and Attributes are always set up again
+        @param previous_doc: mx.Document the graph was built from
+        @return: bool, False if the graph needs a full rebuild
+        """
+        if previous_doc is None or self._built_path != self["mtlXPath"].getValue():
+            return False
+
+        if not self["applyMaterials"].getValue():
+            return False
+
+        x = time.time()
+
+        previous = self.describe_materials(previous_doc)
+        current = self.describe_materials(self.mtlx_doc)
+        box_by_name = {box.getName(): box for box in self.material_list()}
+
+        # Graph was edited after the last build
+        if any(structure and fix_str(name) not in box_by_name for name, (structure, _) in previous.items()):
+            return False
+
+        removed = [name for name in previous if name not in current]
+        rebuilt = []
+        patched = []
+
+        for name, (structure, values) in current.items():
+
+            if name not in previous:
+                rebuilt.append(name)
+                continue
+
+            previous_structure, previous_values = previous[name]
+
+            if structure != previous_structure or values.keys() != previous_values.keys():
+                rebuilt.append(name)
+                continue
+
+            changed_values = [(key, element) for key, element in values.items()
+                              if element.getValueString() != previous_values[key].getValueString()]
+
+            if changed_values:
+
+                # Shaders were deleted from the box after the last build
+                material_box = box_by_name[fix_str(name)]
+
+                if any(material_box.getChild(shader_name) is None for (shader_name, _), _ in changed_values):
+                    return False
+
+                patched.append((name, changed_values))
+
+        if len(removed) + len(rebuilt) + len(patched) > len(current) * REBUILD_CHANGE_RATIO:
+            return False
+
+        for name in removed:
+            material_box = box_by_name.pop(fix_str(name), None)
+
+            if material_box is not None:
+                self.removeChild(material_box)
+
+        for name in rebuilt:
+            material = self.mtlx_doc.getMaterial(name)
+            old_box = box_by_name.pop(fix_str(name), None)
+
+            if old_box is not None:
+                self.removeChild(old_box)
+
+            material_box, _ = self.build_material(material, list(material.getShaderRefs()))
+
+            if material_box is not None:
+                self.addChild(material_box)
+                box_by_name[material_box.getName()] = material_box
+
+        for name, changed_values in patched:
+            material_box = box_by_name[fix_str(name)]
+            parm_by_shader = {}
+
+            for (shader_name, input_name), element in changed_values:
+                if shader_name not in parm_by_shader:
+                    parm_by_shader[shader_name] = self.parameters_by_name(material_box[shader_name])
+
+                shader_parm = parm_by_shader[shader_name]
+
+                if input_name in shader_parm:
+                    self.set_input_value(shader_parm[input_name], element.getValue())
+
+        self.chain_materials([box_by_name[fix_str(name)] for name in current if fix_str(name) in box_by_name])
+
+        # Sets up Assignments and Attributes against the updated Materials
+        for child in self.attribute_list() + self.path_filter_list():
+            self.removeChild(child)
+
+        self._assigned_look = None
+        self._attributed_look = None
+
+        look_idx = self["mtlXLook"].getValue()
+
+        if self["applyAssignments"].getValue():
+            self.setup_assignments(look_idx)
+
+        if self["applyAttributes"].getValue():
+            self.setup_attributes(look_idx)
+
+        self.status = "%d Materials updated in %.2f seconds" % (len(removed) + len(rebuilt) + len(patched),
+                                                                 time.time() - x)
+        return True
+
+    def describe_materials(self, mtlx_doc):
+        """
+        Describes document Materials for comparison. The structure holds shader names,
+        shader types and connections, the values map (shader name, input name) to the
+        input element holding the value
+        @param mtlx_doc: mx.Document
+        @return: dict
+        """
+        descriptions = {}
+
+        for material in mtlx_doc.getMaterials():
+
+            structure = []
+            values = {}
+
+            for shader_ref in material.getShaderRefs():
+
+                shader_name = fix_str(shader_ref.getName())
+                bind_inputs = []
+
+                for bind_input in shader_ref.getBindInputs():
+
+                    input_name = str(bind_input.getName())
+                    output = bind_input.getConnectedOutput()
+                    bind_inputs.append((input_name, output.getNodeName() if output is not None else ""))
+
+                    if bind_input.getValue() is not None:
+                        values[(shader_name, input_name)] = bind_input
+
+                structure.append((shader_name, shader_ref.getNodeString(),
+                                  shader_ref.getAttribute("context"), tuple(bind_inputs)))
+
+                for node in self.upstream_nodes(shader_ref, material):
+
+                    if not node.isA(mx.Node):
+                        continue
+
+                    node_name = fix_str(node.getName())
+                    inputs = []
+
+                    for input_parm in node.getInputs():
+
+                        input_name = str(input_parm.getName())
+                        inputs.append((input_name, input_parm.getNodeName(), input_parm.getAttribute("channels")))
+
+                        if input_parm.getValue() is not None:
+                            values[(node_name, input_name)] = input_parm
+
+                    structure.append((node_name, node.getCategory(), tuple(inputs)))
+
+            descriptions[material.getName()] = (tuple(structure), values)
+
+        return descriptions
+
     def material_list(self):
         """
         Gets Materials list
         @return: list
         """
-        return [i for i in self.children() if i.isInstanceOf(Gaffer.Box)]
+        return self.children_of_type(Gaffer.Box)
 
     def attribute_list(self):
         """
         Gets Attribute list
         @return: list
         """
-        return [i for i in self.children() if i.isInstanceOf(GafferArnold.ArnoldAttributes)]
+        return self.children_of_type(GafferArnold.ArnoldAttributes)
 
     def path_filter_list(self):
         """
         Gets Attribute list
         @return: list
         """
-        return [i for i in self.children() if i.isInstanceOf(GafferScene.PathFilter)]
+        return self.children_of_type(GafferScene.PathFilter)
+
+    def children_of_type(self, child_type):
+        """
+        Gets children of one of the GENERATED_TYPES, the index is built lazily
+        in a single children pass and dropped whenever a child is added or removed
+        @param child_type: type
+        @return: list
+        """
+        if self._child_index is None:
+            self._child_index = {i: [] for i in GENERATED_TYPES}
+
+            for child in self.children():
+                for i in GENERATED_TYPES:
+                    if child.isInstanceOf(i):
+                        self._child_index[i].append(child)
+                        break
+
+        return list(self._child_index[child_type])
+
+    def _children_changed(self, parent, child):
+        """
+        Drops the typed children index
+        @param parent: Gaffer.GraphComponent
+        @param child: Gaffer.GraphComponent
+        @return: None
+        """
+        self._child_index = None
 
     def clear_existing_data(self):
         """
         Removes already existing data
         """
-        for material in self.material_list():
-            self.removeChild(material)
+        self._assigned_look = None
+        self._attributed_look = None
 
-        for attribute in self.attribute_list():
-            self.removeChild(attribute)
+        to_remove = [child for child in self.children()
+                     if any(child.isInstanceOf(i) for i in GENERATED_TYPES)]
 
-        for path_filter in self.path_filter_list():
-            self.removeChild(path_filter)
+        for child in to_remove:
+            self.removeChild(child)
 
     def setup_materials(self):
         """
@@ -228,157 +573,198 @@ class MtlXInput(GafferScene.SceneNode):
         x = time.time()
         shader_count = 0
 
-        # Creates Materials
+        material_boxes = []
+
+        # Creates Materials in document order
         for material in self.mtlx_doc.getMaterials():
 
-            material_name = fix_str(material.getName())
+            material_box, material_shader_count = self.build_material(material, list(material.getShaderRefs()))
+            shader_count += material_shader_count
 
-            box_in = Gaffer.BoxIn()
-            box_out = Gaffer.BoxOut()
-            material_box = Gaffer.Box(material_name)
+            if material_box is not None:
+                self.addChild(material_box)
+                material_boxes.append(material_box)
 
-            # Creates shader reference nodes
-            for shader_ref in material.getShaderRefs():
+        self.chain_materials(material_boxes)
 
-                shader_name = fix_str(shader_ref.getName())
+        logger.info("%s Loaded %d shaders in %.2f seconds" % (self.getName(), shader_count, time.time() - x))
 
-                shader = GafferArnold.ArnoldShader(shader_name)
-                shader.loadShader(shader_ref.getNodeString())
+    def chain_materials(self, material_boxes):
+        """
+        Chains Material boxes between the in and out plugs
+        @param material_boxes: list
+        @return: None
+        """
+        for idx, material_box in enumerate(material_boxes):
+            material_box["in"].setInput(material_boxes[idx - 1]["out"] if idx else self["in"])
 
-                shader_assignment = GafferScene.ShaderAssignment()
-                shader_assignment['shader'].setInput(shader["out"])
+        if material_boxes:
+            self["out"].setInput(material_boxes[-1]["out"])
+        else:
+            self["out"].setInput(self["in"])
 
-                box_in.setup(shader_assignment["in"])
-                box_out.setup(shader_assignment["out"])
+    @staticmethod
+    def query_shader_refs(material, shader_refs):
+        """
+        Gets bind inputs and upstream nodes of the shader references
+        @param material: mx.Material
+        @param shader_refs: list
+        @return: dict
+        """
+        ref_data = {}
 
-                shader_assignment["in"].setInput(box_in["out"])
-                box_out["in"].setInput(shader_assignment["out"])
+        for shader_ref in shader_refs:
+            ref_data[shader_ref.getNamePath()] = (list(shader_ref.getBindInputs()),
+                                                  [node for node in MtlXInput.upstream_nodes(shader_ref, material)
+                                                   if node.isA(mx.Node)])
 
-                path_filter = GafferScene.PathFilter()
-                shader_assignment['filter'].setInput(path_filter["out"])
+        return ref_data
 
-                # Displacement Shader
-                if shader_ref.getAttribute("context") == "displacementshader":
-                    dsp_shader =  GafferArnold.ArnoldDisplacement()
-                    shader_assignment['shader'].setInput(dsp_shader["out"])
-                    dsp_shader['map'].setInput(shader["out"])
-                    material_box.addChild(dsp_shader)
+    def build_material(self, material, shader_refs):
+        """
+        Creates an unparented Material box with its Shaders, Input values and Connections
+        @param material: mx.Material
+        @param shader_refs: list
+        @return: tuple
+        """
+        shader_count = 0
 
-                material_box.addChild(shader)
-                material_box.addChild(box_in)
-                material_box.addChild(box_out)
-                material_box.addChild(path_filter)
-                material_box.addChild(shader_assignment)
+        if not shader_refs:
+            return None, shader_count
 
-                box_in.setupPromotedPlug()
-                box_out.setupPromotedPlug()
+        ref_data = self.query_shader_refs(material, shader_refs)
+        material_name = fix_str(material.getName())
 
-                material_list = self.material_list()
+        box_in = Gaffer.BoxIn()
+        box_out = Gaffer.BoxOut()
+        material_box = Gaffer.Box(material_name)
 
-                if material_list:
-                    if material_box != material_list[-1]:
-                        material_box["in"].setInput(material_list[-1]["out"])
+        shader_by_name = {}
+        parm_by_shader = {}
 
-                    material_list[0]["in"].setInput(self["in"])
-                    self["out"].setInput(material_box["out"])
+        # Creates shader reference nodes
+        for shader_ref in shader_refs:
 
-                self.addChild(material_box)
+            shader_name = fix_str(shader_ref.getName())
+            bind_inputs, upstream = ref_data[shader_ref.getNamePath()]
 
-                # Sets shader reference input values
-                for bind_input in shader_ref.getBindInputs():
-                    value = bind_input.getValue()
+            shader = GafferArnold.ArnoldShader(shader_name)
+            shader.loadShader(shader_ref.getNodeString())
 
-                    if value is not None:
+            shader_assignment = GafferScene.ShaderAssignment()
+            shader_assignment['shader'].setInput(shader["out"])
 
-                        shader_parm = shader['parameters']
-                        input_name = str(bind_input.getName())
+            box_in.setup(shader_assignment["in"])
+            box_out.setup(shader_assignment["out"])
 
-                        if input_name in shader_parm:
-                            self.set_input_value(shader_parm[input_name], value)
+            shader_assignment["in"].setInput(box_in["out"])
+            box_out["in"].setInput(shader_assignment["out"])
 
-                # Create shader nodes
-                for graph in shader_ref.traverseGraph(material):
+            path_filter = GafferScene.PathFilter()
+            shader_assignment['filter'].setInput(path_filter["out"])
 
-                    node = graph.getUpstreamElement()
+            # Displacement Shader
+            if shader_ref.getAttribute("context") == "displacementshader":
+                dsp_shader =  GafferArnold.ArnoldDisplacement()
+                shader_assignment['shader'].setInput(dsp_shader["out"])
+                dsp_shader['map'].setInput(shader["out"])
+                material_box.addChild(dsp_shader)
 
-                    if node.isA(mx.Node):
+            material_box.addChild(shader)
+            shader_by_name[shader.getName()] = shader
+            parm_by_shader[shader.getName()] = self.parameters_by_name(shader)
 
-                        shader_list = [i.getName() for i in material_box.children()
-                                   if isinstance(i, GafferArnold.ArnoldShader)]
+            material_box.addChild(box_in)
+            material_box.addChild(box_out)
+            material_box.addChild(path_filter)
+            material_box.addChild(shader_assignment)
 
-                        node_name = fix_str(node.getName())
+            box_in.setupPromotedPlug()
+            box_out.setupPromotedPlug()
 
-                        if node_name not in shader_list:
+            # Sets shader reference input values
+            for bind_input in bind_inputs:
+                value = bind_input.getValue()
 
-                            shader = GafferArnold.ArnoldShader(node_name)
-                            shader.loadShader(node.getCategory())
-                            material_box.addChild(shader)
-                            shader_count += 1
+                if value is not None:
 
-                            # Sets shader input values
-                            for input_parm in node.getInputs():
+                    shader_parm = parm_by_shader[shader.getName()]
+                    input_name = str(bind_input.getName())
 
-                                input_name = str(input_parm.getName())
+                    if input_name in shader_parm:
+                        self.set_input_value(shader_parm[input_name], value)
 
-                                if shader is not None:
+            # Create shader nodes
+            for node in upstream:
 
-                                    shader_parm = shader['parameters']
+                node_name = fix_str(node.getName())
 
-                                    if input_name in shader_parm:
+                if node_name not in shader_by_name:
 
-                                        value = input_parm.getValue()
+                    shader = GafferArnold.ArnoldShader(node_name)
+                    shader.loadShader(node.getCategory())
+                    material_box.addChild(shader)
+                    shader_by_name[shader.getName()] = shader
+                    parm_by_shader[shader.getName()] = self.parameters_by_name(shader)
+                    shader_count += 1
 
-                                        if value is not None:
-                                            self.set_input_value(shader_parm[input_name], value)
-        # Sets Connections
-        for material in self.mtlx_doc.getMaterials():
+                    # Sets shader input values
+                    for input_parm in node.getInputs():
 
-            material_box = self[fix_str(material.getName())]
+                        input_name = str(input_parm.getName())
 
-            for shader_ref in material.getShaderRefs():
+                        if shader is not None:
 
-                shader_name = fix_str(shader_ref.getName())
-                shader = material_box[shader_name]
-                shader_parm = shader['parameters']
+                            shader_parm = parm_by_shader[shader.getName()]
 
-                for bind_input in shader_ref.getBindInputs():
+                            if input_name in shader_parm:
 
-                    input_name = str(bind_input.getName())
-                    output = bind_input.getConnectedOutput()
+                                value = input_parm.getValue()
 
-                    if output is not None:
+                                if value is not None:
+                                    self.set_input_value(shader_parm[input_name], value)
 
-                        node_name = fix_str(output.getNodeName())
+        # Sets Connections
+        for shader_ref in shader_refs:
 
-                        if node_name:
-                            if input_name in shader_parm:
-                                self.set_input_connection(shader_parm[input_name],
-                                                          material_box[node_name]["out"])
+            bind_inputs, upstream = ref_data[shader_ref.getNamePath()]
+
+            shader_name = fix_str(shader_ref.getName())
+            shader_parm = parm_by_shader[shader_name]
 
-                for graph in shader_ref.traverseGraph():
+            for bind_input in bind_inputs:
 
-                    shader_node = graph.getUpstreamElement()
+                input_name = str(bind_input.getName())
+                output = bind_input.getConnectedOutput()
 
-                    if shader_node.isA(mx.Node):
+                if output is not None:
 
-                        shader_name = fix_str(shader_node.getName())
-                        shader = material_box[shader_name]
-                        shader_parm = shader['parameters']
+                    node_name = fix_str(output.getNodeName())
 
-                        for input_parm in shader_node.getInputs():
+                    if node_name:
+                        if input_name in shader_parm:
+                            self.set_input_connection(shader_parm[input_name],
+                                                      shader_by_name[node_name]["out"])
 
-                            input_name = str(input_parm.getName())
-                            node_name = fix_str(input_parm.getNodeName())
+            for shader_node in upstream:
 
-                            if node_name:
-                                if input_name in shader_parm:
+                shader_name = fix_str(shader_node.getName())
+                shader_parm = parm_by_shader[shader_name]
 
-                                    channel_out = str(input_parm.getAttribute("channels"))
-                                    self.set_input_connection(shader_parm[input_name],
-                                                              material_box[node_name]["out"],
-                                                              channel_out)
+                for input_parm in shader_node.getInputs():
 
-        logger.info("%s Loaded %d shaders in %.2f seconds" % (self.getName(), shader_count, time.time() - x))
+                    input_name = str(input_parm.getName())
+                    node_name = fix_str(input_parm.getNodeName())
+
+                    if node_name:
+                        if input_name in shader_parm:
+
+                            channel_out = str(input_parm.getAttribute("channels"))
+                            self.set_input_connection(shader_parm[input_name],
+                                                      shader_by_name[node_name]["out"],
+                                                      channel_out)
+
+        return material_box, shader_count
 
     def setup_assignments(self, look_idx=0):
         """
@@ -391,44 +777,41 @@ class MtlXInput(GafferScene.SceneNode):
         self["mtlXLook"].setValue(look_idx)
 
         if self.mtlx_doc is None:
-            if not self.valid_mtlx():
+            if not self.valid_mtlx() or not self.read_mtlx():
                 return
 
-        # Sets Assignments
-        for idx, look in enumerate(self.mtlx_doc.getLooks()):
-
-            look_name = str(look.getName())
-            Gaffer.Metadata.registerPlugValue(self["mtlXLook"], "preset:" + look_name, idx)
-
-            if look_idx == idx:
+        look_key = (look_idx, id(self.mtlx_doc))
 
-                material_list = self.material_list()
+        if look_key == self._assigned_look:
+            return
 
-                # Reset assignments
-                for mat in material_list:
-                    mat["PathFilter"]["paths"].setValue(IECore.StringVectorData([]))
+        self._assigned_look = look_key
 
-                # Assigns Materials
-                for mat_assign in look.getMaterialAssigns():
+        looks = list(self.mtlx_doc.getLooks())
 
-                    mat_assign_name = fix_str(mat_assign.getReferencedMaterial().getName())
+        # Sets Assignments
+        if 0 <= look_idx < len(looks):
+            look = looks[look_idx]
 
-                    for mat in material_list:
+            material_dict = {mat.getName(): mat for mat in self.material_list()}
+            paths_by_material = collections.defaultdict(list)
 
-                        if mat_assign_name == mat.getName():
+            # Collects assigned paths per Material
+            for mat_assign in look.getMaterialAssigns():
 
-                            value = mat["PathFilter"]["paths"].getValue()
+                mat_assign_name = fix_str(mat_assign.getReferencedMaterial().getName())
 
-                            if value is not None:
+                if mat_assign_name in material_dict:
 
-                                geom_name = mat_assign.getGeom()
-                                split_name = geom_name.split("/")
+                    # Parent location, keeps the trailing '/'
+                    geom_name = mat_assign.getGeom()
+                    paths_by_material[mat_assign_name].append(geom_name[:geom_name.rfind("/") + 1])
 
-                                if split_name:
-                                    value.append(geom_name.replace(split_name[-1], ""))
-                                    mat["PathFilter"]["paths"].setValue(value)
+                    assign_count += 1
 
-                                    assign_count += 1
+            # Assigns Materials, resets the ones without assignments
+            for mat_name, mat in material_dict.items():
+                mat["PathFilter"]["paths"].setValue(IECore.StringVectorData(paths_by_material[mat_name]))
 
         logger.info("%s Loaded %d assignments in %.2f seconds" % (self.getName(), assign_count, time.time() - x))
 
@@ -439,86 +822,111 @@ class MtlXInput(GafferScene.SceneNode):
         self["mtlXLook"].setValue(look_idx)
 
         if self.mtlx_doc is None:
-            if not self.valid_mtlx():
+            if not self.valid_mtlx() or not self.read_mtlx():
                 return
 
+        look_key = (look_idx, id(self.mtlx_doc))
+
+        if look_key == self._attributed_look:
+            return
+
+        self._attributed_look = look_key
+
+        looks = list(self.mtlx_doc.getLooks())
+
         # Sets Attributes
-        for idx, look in enumerate(self.mtlx_doc.getLooks()):
+        if 0 <= look_idx < len(looks):
+            look = looks[look_idx]
+
+            # Continues from the end of the chain, children order may differ
+            # from the chain order once update_mtlx has rebuilt Materials
+            last_out_plug = self["out"].getInput()
 
-            if look_idx == idx:
+            if last_out_plug is None:
+                last_out_plug = self["in"]
 
-                material_list = self.material_list()
+            # Creates an ArnoldAttributes node per group of Visibilities
+            visibilities = iter(look.getVisibilities())
+            attribute_groups = []
 
-                # Assigns Visibility attributes
-                attribute_assignment = None
-                for idx, visibility in enumerate(look.getVisibilities()):
+            while True:
+                group = list(itertools.islice(visibilities, VISIBILITY_GROUP_SIZE))
 
-                    attrib_list = self.attribute_list()
+                if not group:
+                    break
 
-                    if idx % 8 == 0:
+                attribute_assignment = GafferArnold.ArnoldAttributes()
+                path_filter = GafferScene.PathFilter()
 
-                        attribute_assignment = GafferArnold.ArnoldAttributes()
-                        path_filter = GafferScene.PathFilter()
+                attribute_assignment['filter'].setInput(path_filter["out"])
+                attribute_assignment["in"].setInput(last_out_plug)
+                last_out_plug = attribute_assignment["out"]
 
-                        attribute_assignment['filter'].setInput(path_filter["out"])
+                geom_name = group[0].getGeom()
+                path_filter["paths"].setValue(IECore.StringVectorData([geom_name]))
 
-                        if attrib_list:
-                            attribute_assignment["in"].setInput(attrib_list[-1]["out"])
-                        else:
+                self.addChild(attribute_assignment)
+                self.addChild(path_filter)
 
-                            if material_list:
-                                attribute_assignment["in"].setInput(material_list[-1]["out"])
-                            else:
-                                attribute_assignment["in"].setInput(self["in"])
+                attribute_groups.append((attribute_assignment, group))
+                attribute_count += 1
 
-                        geom_name = visibility.getGeom()
-                        path_filter["paths"].setValue(IECore.StringVectorData([geom_name]))
+            # Assigns Visibility attributes
+            for attribute_assignment, group in attribute_groups:
 
-                        self.addChild(attribute_assignment)
-                        self.addChild(path_filter)
+                attributes = attribute_assignment["attributes"]
 
-                        attribute_count += 1
+                for visibility in group:
 
-                    vis_type = visibility.getVisibilityType()
-                    is_visible = visibility.getVisible()
-                    attributes = attribute_assignment["attributes"]
+                    vis_key = VISIBILITY_ATTRIBUTES.get(visibility.getVisibilityType())
 
-                    if vis_type == "camera":
-                        attributes["cameraVisibility"]["enabled"].setValue(True)
-                        attributes["cameraVisibility"]["value"].setValue(is_visible)
+                    if vis_key:
+                        vis_attribute = attributes[vis_key]
+                        vis_attribute["enabled"].setValue(True)
+                        vis_attribute["value"].setValue(visibility.getVisible())
 
-                    elif vis_type == "shadow":
-                        attributes["shadowVisibility"]["enabled"].setValue(True)
-                        attributes["shadowVisibility"]["value"].setValue(is_visible)
+            if attribute_groups:
+                self["out"].setInput(last_out_plug)
 
-                    elif vis_type == "diffuse_transmit":
-                        attributes["diffuseTransmissionVisibility"]["enabled"].setValue(True)
-                        attributes["diffuseTransmissionVisibility"]["value"].setValue(is_visible)
+        logger.info("%s Loaded %d attributes in %.2f seconds" % (self.getName(), attribute_count, time.time() - x))
 
-                    elif vis_type == "specular_transmit":
-                        attributes["specularTransmissionVisibility"]["enabled"].setValue(True)
-                        attributes["specularTransmissionVisibility"]["value"].setValue(is_visible)
+    @staticmethod
+    def parameters_by_name(shader):
+        """
+        Gets shader parameter plugs by name
+        @param shader: GafferArnold.ArnoldShader
+        @return: dict
+        """
+        return {plug.getName(): plug for plug in shader["parameters"].children()}
 
-                    elif vis_type == "volume":
-                        attributes["volumeVisibility"]["enabled"].setValue(True)
-                        attributes["volumeVisibility"]["value"].setValue(is_visible)
+    @staticmethod
+    def upstream_nodes(shader_ref, material=None):
+        """
+        Yields upstream elements of the shader reference, each one only once.
+        The subgraph above an already visited element is pruned, otherwise
+        shared nodes get traversed once per path leading to them
+        @param shader_ref: mx.ShaderRef
+        @param material: mx.Material
+        @return: generator
+        """
+        visited = set()
 
-                    elif vis_type == "diffuse_reflect":
-                        attributes["diffuseReflectionVisibility"]["enabled"].setValue(True)
-                        attributes["diffuseReflectionVisibility"]["value"].setValue(is_visible)
+        if material is None:
+            iterator = shader_ref.traverseGraph()
+        else:
+            iterator = shader_ref.traverseGraph(material)
 
-                    elif vis_type == "specular_reflect":
-                        attributes["specularReflectionVisibility"]["enabled"].setValue(True)
-                        attributes["specularReflectionVisibility"]["value"].setValue(is_visible)
+        for edge in iterator:
 
-                    elif vis_type == "subsurface":
-                        attributes["subsurfaceVisibility"]["enabled"].setValue(True)
-                        attributes["subsurfaceVisibility"]["value"].setValue(is_visible)
+            element = edge.getUpstreamElement()
+            key = element.getNamePath()
 
-                if attribute_assignment is not None:
-                    self["out"].setInput(attribute_assignment["out"])
+            if key in visited:
+                iterator.setPruneSubgraph(True)
+                continue
 
-        logger.info("%s Loaded %d attributes in %.2f seconds" % (self.getName(), attribute_count, time.time() - x))
+            visited.add(key)
+            yield element
 
     @staticmethod
     def set_input_value(input_plug, value):
@@ -559,52 +967,71 @@ class MtlXInput(GafferScene.SceneNode):
         assert (output_plug.isInstanceOf(Gaffer.Plug))
 
         try:
-            if (output_plug.isInstanceOf(Gaffer.FloatPlug) or
-                    output_plug.isInstanceOf(Gaffer.IntPlug)) and \
-                    (input_plug.isInstanceOf(Gaffer.Color3fPlug) or
-                         input_plug.isInstanceOf(Gaffer.Color4fPlug)):
+            connection = PLUG_CONNECTIONS.get((MtlXInput._plug_kind(input_plug),
+                                               MtlXInput._plug_kind(output_plug)))
 
-                ch_in = input_plug.keys()[0]
-                input_plug[ch_in].setInput(output_plug)
+            if connection == "first_channel":
+                MtlXInput._connect_first_channel(input_plug, output_plug)
 
-            elif (input_plug.isInstanceOf(Gaffer.FloatPlug) or
-                      input_plug.isInstanceOf(Gaffer.IntPlug)) and \
-                    (output_plug.isInstanceOf(Gaffer.Color3fPlug) or
-                         output_plug.isInstanceOf(Gaffer.Color4fPlug)):
+            elif connection == "from_channel":
+                MtlXInput._connect_from_channel(input_plug, output_plug, ch_out)
 
-                if not ch_out:
-                    ch_out = output_plug.keys()[0]
-                input_plug.setInput(output_plug[ch_out])
+            elif connection == "rgb":
+                MtlXInput._connect_rgb_channels(input_plug, output_plug)
 
-            elif (input_plug.isInstanceOf(Gaffer.Color4fPlug) and
-                      output_plug.isInstanceOf(Gaffer.Color3fPlug)) or \
-                    (input_plug.isInstanceOf(Gaffer.Color3fPlug) and
-                         output_plug.isInstanceOf(Gaffer.Color4fPlug)) or \
-                    (input_plug.isInstanceOf(Gaffer.Color4fPlug) and
-                         output_plug.isInstanceOf(Gaffer.V3fPlug)):
-
-                input_plug[input_plug.keys()[0]].setInput(output_plug[output_plug.keys()[0]])
-                input_plug[input_plug.keys()[1]].setInput(output_plug[output_plug.keys()[1]])
-                input_plug[input_plug.keys()[2]].setInput(output_plug[output_plug.keys()[2]])
+            else:
+                input_plug.setInput(output_plug)
 
-            elif (output_plug.isInstanceOf(Gaffer.FloatPlug) or
-                    output_plug.isInstanceOf(Gaffer.IntPlug)) and input_plug.isInstanceOf(Gaffer.V3fPlug):
+        except Exception as err:
+            logger.warning("Failed to connect '%s' -> '%s'\n%s" % (output_plug, input_plug, err))
 
-                ch_in = input_plug.keys()[0]
-                input_plug[ch_in].setInput(output_plug)
+    @staticmethod
+    def _plug_kind(plug):
+        """
+        Gets the connection kind of a plug
+        @param plug: Gaffer.Plug
+        @return: str or None
+        """
+        for plug_type, kind in PLUG_KINDS:
+            if plug.isInstanceOf(plug_type):
+                return kind
 
-            elif (input_plug.isInstanceOf(Gaffer.FloatPlug) or
-                      input_plug.isInstanceOf(Gaffer.IntPlug)) and output_plug.isInstanceOf(Gaffer.V3fPlug):
+    @staticmethod
+    def _connect_first_channel(input_plug, output_plug):
+        """
+        Connects a scalar output to the first channel of a compound input
+        @param input_plug: Gaffer.Plug
+        @param output_plug: Gaffer.Plug
+        @return: None
+        """
+        input_plug[input_plug.keys()[0]].setInput(output_plug)
 
-                if not ch_out:
-                    ch_out = output_plug.keys()[0]
-                input_plug.setInput(output_plug[ch_out])
+    @staticmethod
+    def _connect_from_channel(input_plug, output_plug, ch_out):
+        """
+        Connects a channel of a compound output to a scalar input
+        @param input_plug: Gaffer.Plug
+        @param output_plug: Gaffer.Plug
+        @param ch_out: str
+        @return: None
+        """
+        if not ch_out:
+            ch_out = output_plug.keys()[0]
+        input_plug.setInput(output_plug[ch_out])
 
-            else:
-                input_plug.setInput(output_plug)
+    @staticmethod
+    def _connect_rgb_channels(input_plug, output_plug):
+        """
+        Connects the first three channels of compound plugs
+        @param input_plug: Gaffer.Plug
+        @param output_plug: Gaffer.Plug
+        @return: None
+        """
+        in_keys = input_plug.keys()
+        out_keys = output_plug.keys()
 
-        except Exception as err:
-            logger.warning("Failed to connect '%s' -> '%s'\n%s" % (output_plug, input_plug, err))
+        for idx in range(3):
+            input_plug[in_keys[idx]].setInput(output_plug[out_keys[idx]])
 
 
 IECore.registerRunTimeTyped(MtlXInput, typeName="mtlx_input.MtlXInput")